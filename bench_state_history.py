@@ -0,0 +1,100 @@
+"""Speicherwachstum des Undo/Redo-Verlaufs über lange Sessions messen.
+
+Simuliert eine Session mit dem gespeicherten Zustand der App (Status-Flags, Gate-/Phasen-
+Antworten, Freitexte) und zufälligen Eingaben. Verglichen wird der Verlauf (PMap mit
+Structural Sharing) mit einer tiefen Kopie des Zustands pro Version.
+
+    python bench_state_history.py              # 1k / 5k / 20k Änderungen
+    python bench_state_history.py 50000 --seed 7
+"""
+import argparse
+import copy
+import random
+import time
+import tracemalloc
+
+from state_history import StateHistory
+
+
+def make_state() -> dict:
+    state = {k: False for k in (
+        "phase0_complete", "gate1_complete", "phase1_complete", "gate2_complete",
+        "phase2_complete", "gate3_complete", "phase3_complete", "gate4_complete",
+        "phase4_complete", "gate5_complete", "phase5_complete", "postimpl_complete", "all_complete",
+    )}
+    state.update({"prozess_id": "a1b2c3d4e5f6", "prozessname": "Eingangsrechnungen prüfen",
+                  "prozessowner": "Buchhaltung", "p1_systeme": "SAP S/4HANA, Outlook",
+                  "p1_betreiber": "ops@firma.de", "p1_wartung": "it@firma.de", "p2_entwickler": "RPA-Team",
+                  "g2_dauer_min": 15, "g2_freq_w": 20, "g2_benefits": ["Standardisierung"], "g2_score": 71.43})
+    for prefix, n in (("g1_", 8), ("g2_", 12), ("g3_", 11), ("g4_", 6), ("p3_", 2), ("p4_", 7), ("p5_", 7)):
+        state.update({f"{prefix}q{i}": "Ja" for i in range(n)})
+    return state
+
+
+def edit(state: dict, rnd: random.Random):
+    k = rnd.choice(list(state))
+    v = state[k]
+    if isinstance(v, bool):
+        state[k] = not v
+    elif v in ("Ja", "Nein", "Unbekannt"):
+        state[k] = rnd.choice([x for x in ("Ja", "Nein", "Unbekannt") if x != v])
+    elif isinstance(v, (int, float)):
+        state[k] = v + 1
+    elif isinstance(v, list):
+        state[k] = v + ["Geringere Fehlerquote"] if len(v) < 7 else []
+    else:
+        state[k] = f"{v[:40]} {rnd.randrange(100)}"
+
+
+def bench(n_edits: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    state = make_state()
+    hist = StateHistory()
+    hist.MAX_VERSIONS = n_edits + 1   # Kappung aus, um das reine Wachstum zu sehen
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    hist.record(state, "Start")
+    for i in range(n_edits):
+        edit(state, rnd)
+        hist.record(state, "Änderung", gate=(i % 50 == 0))
+    dt = time.perf_counter() - t0
+    hist_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    # Vergleich: tiefe Kopie des Zustands pro Version
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    copies = [copy.deepcopy(state) for _ in range(len(hist.versions))]
+    copy_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del copies
+
+    n_versions, n_nodes, n_unshared = hist.stats()
+    return {
+        "edits": n_edits, "keys": len(state), "versions": n_versions,
+        "us_per_record": dt / (n_edits + 1) * 1e6,
+        "bytes_per_version": hist_bytes / n_versions,
+        "deepcopy_bytes_per_version": copy_bytes / n_versions,
+        "nodes": n_nodes, "nodes_unshared": n_unshared,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("edits", nargs="*", type=int, default=[1000, 5000, 20000])
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    print(f"{'Änderungen':>10} {'Keys':>5} {'Versionen':>9} {'µs/Version':>10} "
+          f"{'B/Version':>10} {'B/Kopie':>8} {'Knoten':>8} {'ohne Sharing':>12}")
+    for n in args.edits:
+        r = bench(n, args.seed)
+        print(f"{r['edits']:>10} {r['keys']:>5} {r['versions']:>9} {r['us_per_record']:>10.1f} "
+              f"{r['bytes_per_version']:>10.0f} {r['deepcopy_bytes_per_version']:>8.0f} "
+              f"{r['nodes']:>8} {r['nodes_unshared']:>12}")
+
+
+if __name__ == "__main__":
+    main()
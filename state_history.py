@@ -0,0 +1,214 @@
+"""Versionierter Zustand für Undo/Redo im RPA-Stage-Gate-Tool.
+
+PMap ist eine persistente Map (Hash-Trie); StateHistory hält die Versionen des
+gespeicherten Zustands. Ohne Streamlit-Abhängigkeit, damit sich der Speicherbedarf
+separat messen lässt (siehe bench_state_history.py).
+"""
+import copy
+
+
+class _Node:
+    __slots__ = ("slots",)
+    def __init__(self, slots):
+        self.slots = slots        # Tupel mit 32 Einträgen: None | (key, value) | _Node | _Bucket
+
+class _Bucket:
+    __slots__ = ("items",)        # volle Hash-Kollision: Tupel von (key, value)
+    def __init__(self, items):
+        self.items = items
+
+_MISSING = object()
+_EMPTY_NODE = _Node((None,) * 32)
+
+
+class PMap:
+    """Persistente Map als Hash-Trie (32-fach, 5 Bit pro Ebene).
+
+    set()/delete() liefern eine neue Map und kopieren nur den Pfad zur Änderung;
+    alle übrigen Knoten werden mit der alten Version geteilt. Ohne Änderung kommt
+    dieselbe Instanz zurück (billiger "hat sich etwas geändert?"-Test per `is`).
+    """
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, root=_EMPTY_NODE, n: int = 0):
+        self._root, self._len = root, n
+
+    def __len__(self):
+        return self._len
+
+    @staticmethod
+    def _hash(key) -> int:
+        return hash(key) & 0xFFFFFFFFFFFFFFFF
+
+    def get(self, key, default=None):
+        h, node, shift = self._hash(key), self._root, 0
+        while True:
+            slot = node.slots[(h >> shift) & 31]
+            if slot is None:
+                return default
+            if type(slot) is _Node:
+                node, shift = slot, shift + 5
+                continue
+            if type(slot) is _Bucket:
+                return next((v for k, v in slot.items if k == key), default)
+            return slot[1] if slot[0] == key else default
+
+    def set(self, key, value) -> "PMap":
+        root, added = self._set(self._root, key, value, self._hash(key), 0)
+        return self if root is self._root else PMap(root, self._len + added)
+
+    def delete(self, key) -> "PMap":
+        root = self._delete(self._root, key, self._hash(key), 0)
+        return self if root is self._root else PMap(root or _EMPTY_NODE, self._len - 1)
+
+    def items(self):
+        stack = [self._root]
+        while stack:
+            for slot in stack.pop().slots:
+                if slot is None:
+                    continue
+                if type(slot) is _Node:
+                    stack.append(slot)
+                elif type(slot) is _Bucket:
+                    yield from slot.items
+                else:
+                    yield slot
+
+    def nodes(self):
+        """Alle internen Knoten (für die Speicher-Statistik des Verlaufs)."""
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(s for s in node.slots if type(s) is _Node)
+
+    @classmethod
+    def _set(cls, node, key, value, h, shift):
+        idx = (h >> shift) & 31
+        slot = node.slots[idx]
+        added = False
+        if slot is None:
+            new, added = (key, value), True
+        elif type(slot) is _Node:
+            new, added = cls._set(slot, key, value, h, shift + 5)
+        elif type(slot) is _Bucket:
+            if any(k == key and (v is value or v == value) for k, v in slot.items):
+                return node, False
+            items = tuple(kv for kv in slot.items if kv[0] != key)
+            added = len(items) == len(slot.items)
+            new = _Bucket(items + ((key, value),))
+        elif slot[0] == key:
+            if slot[1] is value or slot[1] == value:
+                return node, False
+            new = (key, value)
+        else:
+            new, added = cls._split(slot, cls._hash(slot[0]), (key, value), h, shift + 5), True
+        if new is slot:
+            return node, False
+        slots = list(node.slots)
+        slots[idx] = new
+        return _Node(tuple(slots)), added
+
+    @classmethod
+    def _split(cls, e1, h1, e2, h2, shift):
+        if shift >= 64:
+            return _Bucket((e1, e2))
+        i1, i2 = (h1 >> shift) & 31, (h2 >> shift) & 31
+        slots = [None] * 32
+        if i1 == i2:
+            slots[i1] = cls._split(e1, h1, e2, h2, shift + 5)
+        else:
+            slots[i1], slots[i2] = e1, e2
+        return _Node(tuple(slots))
+
+    @classmethod
+    def _delete(cls, node, key, h, shift):
+        # Liefert den neuen Knoten, denselben (nichts gefunden) oder None (leer)
+        idx = (h >> shift) & 31
+        slot = node.slots[idx]
+        if slot is None:
+            return node
+        if type(slot) is _Node:
+            new = cls._delete(slot, key, h, shift + 5)
+        elif type(slot) is _Bucket:
+            items = tuple(kv for kv in slot.items if kv[0] != key)
+            new = slot if len(items) == len(slot.items) else (_Bucket(items) if len(items) > 1 else items[0])
+        else:
+            new = None if slot[0] == key else slot
+        if new is slot:
+            return node
+        slots = list(node.slots)
+        slots[idx] = new
+        return None if all(s is None for s in slots) else _Node(tuple(slots))
+
+
+class StateHistory:
+    """Versionen des gespeicherten (whitelisted) Zustands; Kosten pro Version ~ geänderte Keys."""
+
+    MAX_VERSIONS = 500
+
+    def __init__(self):
+        self.versions = []   # [(label, PMap, gate_decision)]
+        self.cursor = -1
+        self._defaults = {}  # Keys, die seit der letzten Version neu aufgetaucht sind
+
+    @property
+    def head(self) -> PMap:
+        return self.versions[self.cursor][1] if self.versions else PMap()
+
+    def record(self, state: dict, label: str, gate: bool = False) -> bool:
+        """Neue Version, wenn sich ein bekannter Key geändert hat (oder bei Gate-Entscheidungen).
+
+        Keys, die weder die aktuelle Version noch ein früherer Lauf kennt, sind frisch
+        gerenderte Widget-Defaults: sie werden gemerkt, lösen aber keine Version aus und
+        verwerfen damit auch kein Redo-Ende.
+        """
+        head = self.head
+        edited = False
+        for k, v in state.items():
+            base = head.get(k, _MISSING)
+            if base is _MISSING:
+                base = self._defaults.get(k, _MISSING)
+            if base is _MISSING:   # Lauf endete vorzeitig (st.stop/st.rerun) – jetzt nachholen
+                self._defaults[k] = copy.deepcopy(v)
+            elif base != v:
+                edited = True
+        if not edited and not gate and self.versions:
+            return False
+
+        new = head
+        for k, v in state.items():
+            if new.get(k, _MISSING) != v:
+                new = new.set(k, copy.deepcopy(v))
+        self._defaults.clear()
+        # Neuer Zweig: Redo-Ende verwerfen
+        del self.versions[self.cursor + 1:]
+        self.versions.append((label, new, gate))
+        if len(self.versions) > self.MAX_VERSIONS:
+            del self.versions[0]
+        self.cursor = len(self.versions) - 1
+        return True
+
+    def note_defaults(self, state: dict):
+        """Am Ende eines Laufs: neu gerenderte Widget-Keys mit ihren Defaults merken, damit
+        eine Eingabe im nächsten Lauf als Änderung erkannt wird."""
+        head = self.head
+        for k, v in state.items():
+            if k not in self._defaults and head.get(k, _MISSING) is _MISSING:
+                self._defaults[k] = copy.deepcopy(v)
+
+    def restore(self, index: int) -> dict:
+        """Cursor auf eine Version setzen und deren Zustand liefern (ohne neue Version)."""
+        self.cursor = max(0, min(index, len(self.versions) - 1))
+        self._defaults.clear()
+        return dict(self.head.items())
+
+    def stats(self) -> tuple[int, int, int]:
+        """(Versionen, tatsächlich gehaltene Knoten, Knoten ohne Sharing)."""
+        seen, total = set(), 0
+        for _, m, _ in self.versions:
+            for node in m.nodes():
+                total += 1
+                seen.add(id(node))
+        return len(self.versions), len(seen), total
@@ -1,6 +1,10 @@
 import streamlit as st
 import re
-import json, gzip, re, time, hashlib
+import json, gzip, re, time, hashlib, heapq, threading, uuid, random, bisect, os, copy
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from state_history import StateHistory
 from datetime import date
 
 st.set_page_config(page_title="RPA Stage-Gate-Modell", layout="wide", initial_sidebar_state="expanded")
@@ -21,6 +25,27 @@ div[data-testid="column"] { overflow: visible !important; }
 """, unsafe_allow_html=True)
 
 
+# ==== Verlauf (Undo/Redo): persistente Map, Versionen teilen sich unveränderte Knoten ====
+def _history() -> StateHistory:
+    return st.session_state.setdefault("_history", StateHistory())
+
+
+def _record_version(label: str, gate: bool = False):
+    _history().record(make_save_state(), label, gate)
+
+
+def _apply_pending_restore() -> bool:
+    # Muss vor allen Widgets und vor dem Export laufen (Widget-Keys dürfen danach nicht
+    # mehr gesetzt werden, die Download-Buttons sollen schon den neuen Stand enthalten)
+    if "_history_restore" not in st.session_state:
+        return False
+    restored = _history().restore(st.session_state.pop("_history_restore"))
+    for k in set(make_save_state()) - set(restored):
+        del st.session_state[k]
+    st.session_state.update(copy.deepcopy(restored))
+    return True
+
+
 with st.sidebar:
     st.markdown("### 💾 Zwischenstand")
 
@@ -30,6 +55,7 @@ with st.sidebar:
 
     # Nur erlaubte Keys sichern
     STATUS_KEYS = {
+        "prozess_id",
         "phase0_complete","gate1_complete","phase1_complete","gate2_complete",
         "phase2_complete","gate3_complete","phase3_complete","gate4_complete",
         "phase4_complete","gate5_complete","phase5_complete",
@@ -57,6 +83,8 @@ with st.sidebar:
                     out[k] = v
         return out
 
+    _restored_this_run = _apply_pending_restore()
+
     safe_name = _slug(st.session_state.get("prozessname", "Unbenannter Prozess"))
     base_filename = f"{safe_name}_rpa_stagegate_{date.today().isoformat()}"
 
@@ -84,6 +112,41 @@ with st.sidebar:
             st.rerun()
 
 # ==== Lade-Logik (außerhalb der Sidebar, wie bei dir) ====
+def _clean_state(loaded: dict, fallback_id: str) -> dict:
+    # Whitelist anwenden
+    def _is_allowed(k: str) -> bool:
+        return (k in STATUS_KEYS) or any(k.startswith(p) for p in PREFIXES)
+    cleaned = {str(k): v for k, v in loaded.items() if _is_allowed(str(k))}
+
+    # evtl. alte Keys auf neue mappen (optional)
+    mapping = {
+        "gate3_complet": "gate3_complete",  # Tippfehler alt → neu
+        "stage1_complete": "gate1_complete",
+        "stage2_complete": "phase1_complete",
+    }
+    for old, new in mapping.items():
+        if old in cleaned and new not in cleaned:
+            cleaned[new] = cleaned.pop(old)
+
+    # Freitext-Keys müssen Strings sein (Slug, Suche, Portfolio-Key)
+    for k in ("prozessname", "prozess_id"):
+        if k in cleaned and not isinstance(cleaned[k], str):
+            del cleaned[k]
+
+    # Alte Stände ohne ID: aus dem Dateiinhalt ableiten (gleichnamige Prozesse bleiben getrennt)
+    if not cleaned.get("prozess_id"):
+        cleaned["prozess_id"] = fallback_id
+    return cleaned
+
+def _content_id(data_bytes: bytes) -> str:
+    return hashlib.md5(data_bytes).hexdigest()[:12]
+
+def _read_snapshot(name: str, data_bytes: bytes):
+    # GZip auto-erkennen
+    if name.endswith(".gz") or (len(data_bytes)>=2 and data_bytes[0]==0x1F and data_bytes[1]==0x8B):
+        data_bytes = gzip.decompress(data_bytes)
+    return json.loads(data_bytes.decode("utf-8", errors="strict"))
+
 def _file_signature(file_obj) -> tuple[str, bytes]:
     data = file_obj.getvalue()
     # schnelle, eindeutige Signatur (Name + Größe + Hash)
@@ -95,35 +158,19 @@ if 'uploaded' in locals() and uploaded is not None:
         sig, data_bytes = _file_signature(uploaded)
         # Nur verarbeiten, wenn neu (verhindert Endlos-Reloads)
         if st.session_state.get("_loaded_sig") != sig:
-            # GZip auto-erkennen
-            if uploaded.name.endswith(".gz") or (len(data_bytes)>=2 and data_bytes[0]==0x1F and data_bytes[1]==0x8B):
-                data_bytes = gzip.decompress(data_bytes)
-            text = data_bytes.decode("utf-8", errors="strict")
-            loaded = json.loads(text)
+            loaded = _read_snapshot(uploaded.name, data_bytes)
             if not isinstance(loaded, dict):
                 st.error("Ungültiges Format: Erwartet JSON-Objekt (Key→Value).")
             else:
-                # Whitelist anwenden
-                def _is_allowed(k: str) -> bool:
-                    return (k in STATUS_KEYS) or any(k.startswith(p) for p in PREFIXES)
-                cleaned = {str(k): v for k, v in loaded.items() if _is_allowed(str(k))}
-
-                # evtl. alte Keys auf neue mappen (optional)
-                mapping = {
-                    "gate3_complet": "gate3_complete",  # Tippfehler alt → neu
-                    "stage1_complete": "gate1_complete",
-                    "stage2_complete": "phase1_complete",
-                }
-                for old, new in mapping.items():
-                    if old in cleaned and new not in cleaned:
-                        cleaned[new] = cleaned.pop(old)
+                cleaned = _clean_state(loaded, _content_id(data_bytes))
 
                 # Kritische UI-Keys entfernen (Sicherheit)
                 for bad in ("uploader", "uploader_fast", "dl_json", "dl_gz", "dl_json_fast", "dl_gz_fast"):
                     st.session_state.pop(bad, None)
 
-                # State übernehmen
+                # State übernehmen (Dubletten-Hinweise gehörten zum vorherigen Prozess)
                 st.session_state.update(cleaned)
+                st.session_state.pop("_dup_hits", None)
 
                 # Merken, dass diese Datei geladen wurde
                 st.session_state["_loaded_sig"] = sig
@@ -149,6 +196,14 @@ if 'uploaded' in locals() and uploaded is not None:
 for key in ["phase0_complete", "gate1_complete", "phase1_complete", "gate2_complete", "phase2_complete", "gate3_complete",
     "phase3_complete",  "gate4_complete", "phase4_complete", "gate5_complete", "phase5_complete", "postimpl_complete",  "all_complete"]:
         st.session_state.setdefault(key, False)
+st.session_state.setdefault("prozess_id", uuid.uuid4().hex[:12])
+
+
+# Änderungen aus dem letzten Lauf (Eingaben, Laden) als eigene Version festhalten – nicht
+# in dem Lauf, der gerade eine Version wiederhergestellt hat. Vom Framework aufgeräumte
+# Widget-Keys (Abschnitt ausgeblendet) und neue Widget-Defaults zählen nicht als Änderung.
+if not _restored_this_run:
+    _record_version("Start" if not _history().versions else "Änderung")
 
 EMAIL_RE = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$")
 
@@ -169,33 +224,985 @@ _STEPS_V = [
     {"type":"end"  ,"key":"end","label":"Post-\nImplementation-\nCheck"},
 ]
 
-def _done_v(key: str) -> bool:
+def _done_v(key: str, state=None) -> bool:
+    state = st.session_state if state is None else state
     flags = {
-        "start": st.session_state.get("phase0_complete", False),
-        "g1":    st.session_state.get("gate1_complete", False),
-        "p1":    st.session_state.get("phase1_complete", False),
-        "g2":    st.session_state.get("gate2_complete", False),
-        "p2":    st.session_state.get("phase2_complete", False),
-        "g3":    st.session_state.get("gate3_complete", False),
-        "p3":    st.session_state.get("phase3_complete", False),
-        "g4":    st.session_state.get("gate4_complete", False),
-        "p4":    st.session_state.get("phase4_complete", False),
-        "g5":    st.session_state.get("gate5_complete", False),
-        "p5":    st.session_state.get("phase5_complete", False),
-        "end":   st.session_state.get("postimpl_complete", False) or st.session_state.get("all_complete", False),
+        "start": state.get("phase0_complete", False),
+        "g1":    state.get("gate1_complete", False),
+        "p1":    state.get("phase1_complete", False),
+        "g2":    state.get("gate2_complete", False),
+        "p2":    state.get("phase2_complete", False),
+        "g3":    state.get("gate3_complete", False),
+        "p3":    state.get("phase3_complete", False),
+        "g4":    state.get("gate4_complete", False),
+        "p4":    state.get("phase4_complete", False),
+        "g5":    state.get("gate5_complete", False),
+        "p5":    state.get("phase5_complete", False),
+        "end":   state.get("postimpl_complete", False) or state.get("all_complete", False),
     }
     return bool(flags.get(key, False))
 
 
 _order = [s["key"] for s in _STEPS_V]
-def _current_idx_v() -> int:
+def _current_idx_v(state=None) -> int:
     for i, k in enumerate(_order):
         if k == "start":
             continue
-        if not _done_v(k):
+        if not _done_v(k, state):
             return max(0, i-1)
     return len(_order) - 1
 
+_STAGE_LABELS = {s["key"]: " ".join([s["label"].replace("\n", " ")] + ([f"({s['xlabel']})"] if s.get("xlabel") else []))
+                 for s in _STEPS_V}
+
+
+def _cost_benefit(state) -> dict:
+    """Kosten/Nutzen aus den Post-Impl-Eingaben (Session State oder gespeicherter Stand)."""
+    err_rate   = float(state.get("pic_err_rate", 0.0) or 0.0)
+    mttr_min   = float(state.get("pic_fix_min", 0.0) or 0.0)
+    save_min_w = float(state.get("pic_save_min", 0.0) or 0.0)
+    runs_w     = int(state.get("pic_runs_week", 0) or 0)
+    rate_eur_h = float(state.get("pic_hourly_cost", 20.0) or 0.0)
+
+    error_events_per_week = runs_w * (err_rate / 100.0)
+    error_minutes_week    = error_events_per_week * mttr_min
+    error_cost_week       = (error_minutes_week / 60.0) * rate_eur_h
+
+    saving_cost_week      = (save_min_w / 60.0) * rate_eur_h
+    net_benefit_week      = saving_cost_week - error_cost_week
+    return {
+        "error_cost_week": error_cost_week,
+        "saving_cost_week": saving_cost_week,
+        "net_benefit_week": net_benefit_week,
+        "net_benefit_year": net_benefit_week * 52,
+        "runs_per_week": runs_w,
+        "hourly_cost": rate_eur_h,
+    }
+
+
+# ==== Portfolio: serverweit geteilt (alle Sessions), nicht pro Session ====
+class RankingIndex:
+    """Top-k nach (Gate-2-Score, Netto-Nutzen/Jahr), ein Heap pro Stage.
+
+    Update = ein heappush (O(log n)); der alte Eintrag bleibt liegen und wird beim
+    Lesen übersprungen (Lazy Deletion). Top-k läuft die Heaps über eine Frontier ab
+    (Kinder von i liegen bei 2i+1/2i+2), ohne sie zu verändern: O(k log k).
+    """
+
+    def __init__(self):
+        self._heaps = {}   # stage -> [(-score, -nutzen, pid, version)]
+        self._live = {}    # pid -> (stage, aktueller Eintrag); Identität zählt
+        self._stale = 0
+
+    def __len__(self):
+        return len(self._live)
+
+    def update(self, pid: str, stage: str, score: float, nutzen: float):
+        prev = self._live.get(pid)
+        if prev is not None:
+            if prev[0] == stage and prev[1][:2] == (-score, -nutzen):
+                return
+            self._stale += 1
+        entry = (-float(score), -float(nutzen), pid, (prev[1][3] + 1) if prev else 0)
+        self._live[pid] = (stage, entry)
+        heapq.heappush(self._heaps.setdefault(stage, []), entry)
+        self._maybe_compact()
+
+    def remove(self, pid: str):
+        if self._live.pop(pid, None) is not None:
+            self._stale += 1
+            self._maybe_compact()
+
+    def _valid(self, entry) -> bool:
+        live = self._live.get(entry[2])
+        return live is not None and live[1] is entry
+
+    def _maybe_compact(self):
+        # Heaps aufräumen, sobald mehr veraltete als gültige Einträge herumliegen
+        if self._stale > 1024 and self._stale > len(self._live):
+            for h in self._heaps.values():
+                h[:] = [e for e in h if self._valid(e)]
+                heapq.heapify(h)
+            self._stale = 0
+
+    def top(self, k: int, stages=None) -> list:
+        heaps = [self._heaps[s] for s in (stages or list(self._heaps)) if s in self._heaps]
+        frontier = [(h[0], j, 0) for j, h in enumerate(heaps) if h]
+        heapq.heapify(frontier)
+        out = []
+        while frontier and len(out) < k:
+            entry, j, i = heapq.heappop(frontier)
+            h = heaps[j]
+            for c in (2*i + 1, 2*i + 2):
+                if c < len(h):
+                    heapq.heappush(frontier, (h[c], j, c))
+            if self._valid(entry):
+                out.append((entry[2], -entry[0], -entry[1]))
+        return out
+
+
+def _dup_features(state) -> tuple[frozenset, dict]:
+    """Merkmale für die Dublettensuche: Namens-Trigramme + IT-Systeme (Text) und Antwortvektor."""
+    name = re.sub(r"[^\w]+", " ", str(state.get("prozessname", "")).lower()).strip()
+    padded = f" {name} "
+    toks = {"n:" + padded[i:i+3] for i in range(max(0, len(padded) - 2))}
+    systeme = [t.strip() for t in re.split(r"[,;/+&\n]+|\bund\b", str(state.get("p1_systeme", "") or "").lower())]
+    toks |= {"s:" + t for t in systeme if t}
+    # Antworten der Ja/Nein-Gates (g1_, g2_, ...) – nur Strings, keine Scores/Zahlen
+    answers = {k: v for k, v in state.items() if k.startswith(("g1_", "g2_", "g3_", "g4_")) and isinstance(v, str)}
+    return frozenset(toks), answers
+
+
+class DuplicateIndex:
+    """MinHash-Signaturen + LSH-Buckets (Banding) für sublineare Dubletten-Kandidaten.
+
+    Gebucketet wird nur über den Text (Name, Systeme): zwei Prozesse teilen mit hoher
+    Wahrscheinlichkeit einen Bucket, wenn ihre Jaccard-Ähnlichkeit über
+    ~(1/BANDS)^(1/ROWS) liegt. Für die Kandidaten wird die Ähnlichkeit aus der
+    Signatur geschätzt und mit der Übereinstimmung der Antworten gewichtet.
+    """
+
+    BANDS, ROWS = 16, 4
+    ANSWER_WEIGHT = 0.2
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, seed: int = 1):
+        rnd = random.Random(seed)
+        n = self.BANDS * self.ROWS
+        self._perms = [(rnd.randrange(1, self._PRIME), rnd.randrange(0, self._PRIME)) for _ in range(n)]
+        self._buckets = {}   # (band, rows) -> {pid}
+        self._sigs = {}      # pid -> (tokens, signatur, antworten)
+
+    def __len__(self):
+        return len(self._sigs)
+
+    def signature(self, tokens) -> tuple:
+        if not tokens:
+            return ()
+        P = self._PRIME
+        hs = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big") for t in tokens]
+        return tuple(min((a * h + b) % P for h in hs) for a, b in self._perms)
+
+    def _bands(self, sig):
+        R = self.ROWS
+        return [(i, sig[i*R:(i+1)*R]) for i in range(self.BANDS)] if sig else []
+
+    def update(self, pid: str, tokens: frozenset, answers: dict):
+        prev = self._sigs.get(pid)
+        if prev is not None and prev[0] == tokens:
+            self._sigs[pid] = (tokens, prev[1], answers)   # Signatur unverändert
+            return
+        self.remove(pid)
+        sig = self.signature(tokens)
+        self._sigs[pid] = (tokens, sig, answers)
+        for band in self._bands(sig):
+            self._buckets.setdefault(band, set()).add(pid)
+
+    def remove(self, pid: str):
+        prev = self._sigs.pop(pid, None)
+        if prev is None:
+            return
+        for band in self._bands(prev[1]):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del self._buckets[band]
+
+    def similar(self, tokens, answers: dict, threshold: float = 0.5, exclude=None) -> list:
+        sig = self.signature(tokens)
+        cands = set()
+        for band in self._bands(sig):
+            cands |= self._buckets.get(band, set())
+        cands.discard(exclude)
+        out = []
+        for pid in cands:
+            _, other_sig, other_answers = self._sigs[pid]
+            est = sum(x == y for x, y in zip(sig, other_sig)) / len(sig)
+            common = answers.keys() & other_answers.keys()
+            if common:
+                agree = sum(answers[k] == other_answers[k] for k in common) / len(common)
+                est = (1 - self.ANSWER_WEIGHT) * est + self.ANSWER_WEIGHT * agree
+            if est >= threshold:
+                out.append((pid, est))
+        return sorted(out, key=lambda t: -t[1])
+
+
+# ==== Gate 2: Kriterien & Bewertungsprofile ====
+# 12 binäre/ternäre Kriterien (Key -> Frage); gespeichert als g2_<key>
+G2_CRITERIA = {
+    "apps_zugang":       "Sind alle Anwendungen / Software zugänglich?",
+    "schon_autom":       "Ist der Prozess bereits in einer anderen Form automatisiert?",
+    "komplex":           "Ist der Prozess komplex?",
+    "nur_digital":       "Werden nur digitale Daten verwendet?",
+    "aenderung":         "Bleibt der Prozess in näherer Zukunft unverändert?",
+    "stabil_stabile_sw": "Ist der Prozess stabil und verwendet stabile Anwendungen?",
+    "standardisiert":    "Ist der Prozess standardisiert?",
+    "strukturierte":     "Verwendet der Prozess strukturierte Daten?",
+    "begrenzte_ausn":    "Hat der Prozess begrenzte Ausnahmen/Alternativen?",
+    "mehrere_systeme":   "Verwendet der Prozess mehrere Systeme?",
+    "mehrere_personen":  "Wird der Prozess von mehreren Personen bearbeitet?",
+    "richtlinien":       "Sind die Richtlinien des Prozesses eindeutig und klar dokumentiert?",
+}
+G2_TERNARY = {"Ja": 1.0, "Nein": 0.0, "Unbekannt": 0.5}
+G2_BENEFITS = [
+    "Reduzierte Prozesszeiten",
+    "Entlastung der Routinearbeiten",
+    "Geringere Fehlerquote",
+    "Erhöhte Kundenzufriedenheit und -service",
+    "24 / 7 Betrieb",
+    "Verbesserung der Mitarbeitenden-Skills",
+    "Standardisierung",
+]
+
+# Standardprofil = bisherige Formel: gleiche Gewichte, T-Stufen 30/60/180 Min.,
+# Nutzen/7, Normierung /14, Einstufung 50/70
+G2_DEFAULT_PROFILE = {
+    "name": "Standard",
+    "weights": {k: 1.0 for k in G2_CRITERIA},
+    "t_thresholds": [30.0, 60.0, 180.0],     # Minuten/Woche
+    "t_scores": [0.0, 0.25, 0.5, 1.0],       # ein Wert mehr als Schwellen
+    "t_weight": 1.0,
+    "benefit_total": 7.0,
+    "benefit_weight": 1.0,
+    "norm": 14.0,
+    "cutoffs": [50.0, 70.0],                 # geeignet / sehr gut geeignet
+}
+
+G2_BANDS = ["🔴 Ungeeignet", "🟡 Geeignet", "🟢 Sehr gut geeignet", "⚪ ohne Score"]
+
+def _g2_band(score, profile: dict) -> str:
+    if not isinstance(score, (int, float)):
+        return G2_BANDS[3]
+    return G2_BANDS[bisect.bisect_right(profile["cutoffs"], score)]
+
+
+def _g2_features(state):
+    """Antworten -> (12 Kriterienwerte, T in Min./Woche, Anzahl Nutzen); None, wenn unvollständig."""
+    try:
+        crit = [G2_TERNARY[state[f"g2_{k}"]] for k in G2_CRITERIA]
+    except KeyError:
+        return None
+    T = float(state.get("g2_dauer_min", 0) or 0) * float(state.get("g2_freq_w", 0) or 0)
+    return crit, T, len(state.get("g2_benefits") or [])
+
+
+def _gate2_score(features, profile: dict):
+    crit, T, n_benefits = features
+    bin_sum = sum(profile["weights"][k] * v for k, v in zip(G2_CRITERIA, crit))
+    t_score = profile["t_scores"][bisect.bisect_right(profile["t_thresholds"], T)]
+    x = bin_sum + profile["t_weight"] * t_score + profile["benefit_weight"] * n_benefits / profile["benefit_total"]
+    return round((x * 100.0) / profile["norm"], 2)
+
+
+class Gate2Matrix:
+    """Gate-2-Merkmale aller Prozesse als Matrix: Spalten = 12 Kriterien, T, Anzahl Nutzen.
+
+    Damit ist die Neubewertung des Portfolios unter einem anderen Profil ein
+    Matrix-Vektor-Produkt (Kriterien x Gewichte) plus vektorisierte T-Stufen.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._X = np.zeros((capacity, len(G2_CRITERIA) + 2))
+        self._rows = {}   # pid -> Zeile
+        self._pids = []   # Zeile -> pid
+
+    def __len__(self):
+        return len(self._pids)
+
+    def update(self, pid: str, features):
+        if features is None:
+            return self.remove(pid)
+        crit, T, n_benefits = features
+        row = self._rows.get(pid)
+        if row is None:
+            if len(self._pids) == len(self._X):
+                self._X = np.concatenate([self._X, np.zeros_like(self._X)])
+            row = self._rows[pid] = len(self._pids)
+            self._pids.append(pid)
+        self._X[row, :-2] = crit
+        self._X[row, -2:] = (T, n_benefits)
+
+    def remove(self, pid: str):
+        # Letzte Zeile in die Lücke ziehen (O(1))
+        row = self._rows.pop(pid, None)
+        if row is None:
+            return
+        last = len(self._pids) - 1
+        if row != last:
+            self._X[row] = self._X[last]
+            self._pids[row] = self._pids[last]
+            self._rows[self._pids[row]] = row
+        self._pids.pop()
+
+    def snapshot(self) -> tuple[list, np.ndarray]:
+        return list(self._pids), self._X[:len(self._pids)].copy()
+
+
+def _g2_rescore(X: np.ndarray, profile: dict) -> np.ndarray:
+    """Scores für alle Zeilen von Gate2Matrix unter einem Profil (identisch zu _gate2_score)."""
+    w = np.array([profile["weights"][k] for k in G2_CRITERIA])
+    t_idx = np.searchsorted(np.asarray(profile["t_thresholds"]), X[:, -2], side="right")
+    x = (X[:, :-2] @ w
+         + profile["t_weight"] * np.asarray(profile["t_scores"])[t_idx]
+         + profile["benefit_weight"] * X[:, -1] / profile["benefit_total"])
+    return np.round(x * 100.0 / profile["norm"], 2)
+
+
+def _g2_profile_diff_job(job, pids: list, X: np.ndarray, base: dict, alt: dict, records: dict) -> dict:
+    """Bandwechsel zwischen zwei Profilen (läuft als Hintergrund-Job)."""
+    job.report(0.1, "bewerte neu")
+    old, new = _g2_rescore(X, base), _g2_rescore(X, alt)
+    job.report(0.6, "vergleiche Bänder")
+    old_b = np.searchsorted(np.asarray(base["cutoffs"]), old, side="right")
+    new_b = np.searchsorted(np.asarray(alt["cutoffs"]), new, side="right")
+    matrix = {(G2_BANDS[i], G2_BANDS[j]): int(np.count_nonzero((old_b == i) & (new_b == j)))
+              for i in range(3) for j in range(3)}
+    changed = np.flatnonzero(old_b != new_b)
+    return {
+        "n": len(pids),
+        "matrix": matrix,
+        "changed": [
+            {
+                "Prozess": records.get(pids[i], ""),
+                "Score alt": float(old[i]), "Band alt": G2_BANDS[old_b[i]],
+                "Score neu": float(new[i]), "Band neu": G2_BANDS[new_b[i]],
+            }
+            for i in changed[:500]
+        ],
+        "n_changed": int(len(changed)),
+    }
+
+
+# Suchfelder: Feldname in der Suche -> Key im gespeicherten Stand
+SEARCH_FIELDS = {
+    "name": "prozessname",
+    "owner": "prozessowner",
+    "betrieb": "p1_betreiber",
+    "wartung": "p1_wartung",
+    "systeme": "p1_systeme",
+    "entwickler": "p2_entwickler",
+}
+
+def _search_terms(text) -> set:
+    # Ganze Tokens (z. B. komplette E-Mail) plus deren Bestandteile (ops, firma, de)
+    terms = set()
+    for tok in re.findall(r"[\w.@+-]+", str(text or "").lower()):
+        tok = tok.strip(".-+")
+        if tok:
+            terms.add(tok)
+            terms.update(t for t in re.split(r"[.@+-]+", tok) if t)
+    return terms
+
+
+class SearchIndex:
+    """Invertierter Index über die Textfelder + Facetten (Stage, Gate-2-Band).
+
+    Jeder Term wird doppelt geführt: "sap" (alle Felder) und "systeme:sap".
+    Das Vokabular ist sortiert, Präfixe ("sap*") sind damit ein bisect-Bereich.
+    """
+
+    def __init__(self):
+        self._postings = {}   # term -> {pid}
+        self._vocab = []      # sortierte Terme
+        self._docs = {}       # pid -> (terms, facets)
+        self.facets = {"stage": {}, "band": {}}   # facet -> wert -> {pid}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _add_term(self, term, pid):
+        bucket = self._postings.get(term)
+        if bucket is None:
+            bucket = self._postings[term] = set()
+            bisect.insort(self._vocab, term)
+        bucket.add(pid)
+
+    def _drop_term(self, term, pid):
+        bucket = self._postings.get(term)
+        if bucket is None:
+            return
+        bucket.discard(pid)
+        if not bucket:
+            del self._postings[term]
+            i = bisect.bisect_left(self._vocab, term)
+            if i < len(self._vocab) and self._vocab[i] == term:
+                del self._vocab[i]
+
+    def update(self, pid: str, state: dict, band: str):
+        terms = set()
+        for field, key in SEARCH_FIELDS.items():
+            for t in _search_terms(state.get(key)):
+                terms.add(t)
+                terms.add(f"{field}:{t}")
+        facets = {"stage": _order[_current_idx_v(state)], "band": band}
+
+        old_terms, old_facets = self._docs.get(pid, (set(), {}))
+        for t in old_terms - terms:
+            self._drop_term(t, pid)
+        for t in terms - old_terms:
+            self._add_term(t, pid)
+        for f, v in facets.items():
+            if old_facets.get(f) != v:
+                if f in old_facets:
+                    self.facets[f][old_facets[f]].discard(pid)
+                self.facets[f].setdefault(v, set()).add(pid)
+        self._docs[pid] = (terms, facets)
+
+    def set_facet(self, pid: str, facet: str, value: str):
+        terms, facets = self._docs[pid]
+        if facets.get(facet) != value:
+            self.facets[facet][facets[facet]].discard(pid)
+            self.facets[facet].setdefault(value, set()).add(pid)
+            self._docs[pid] = (terms, {**facets, facet: value})
+
+    def remove(self, pid: str):
+        old = self._docs.pop(pid, None)
+        if old is None:
+            return
+        terms, facets = old
+        for t in terms:
+            self._drop_term(t, pid)
+        for f, v in facets.items():
+            self.facets[f][v].discard(pid)
+
+    def _match(self, term: str, prefix: bool) -> set:
+        if not prefix:
+            return self._postings.get(term, set())
+        out = set()
+        i = bisect.bisect_left(self._vocab, term)
+        while i < len(self._vocab) and self._vocab[i].startswith(term):
+            out |= self._postings[self._vocab[i]]
+            i += 1
+        return out
+
+    def _part_matches(self, field: str, value: str, prefix: bool):
+        """Ein Query-Teil wird wie beim Indexieren zerlegt ("SAP S/4HANA," -> sap, s, 4hana).
+        Ganze Tokens, die so nicht im Index stehen ("firma.de"), werden über ihre
+        Bestandteile gesucht; ein `*` gilt für das letzte Token."""
+        scoped = (lambda t: f"{field}:{t}") if field else (lambda t: t)
+        toks = [t.strip(".-+") for t in re.findall(r"[\w.@+-]+", value)]
+        toks = [t for t in toks if t]
+        for i, tok in enumerate(toks):
+            if prefix and i == len(toks) - 1:
+                yield self._match(scoped(tok), True)
+            elif scoped(tok) in self._postings:
+                yield self._postings[scoped(tok)]
+            else:
+                parts = [t for t in re.split(r"[.@+-]+", tok) if t]
+                for t in parts or [tok]:
+                    yield self._postings.get(scoped(t), set())
+
+    def search(self, query: str, filters=None) -> tuple[set, dict]:
+        """UND-Verknüpfung aller Query-Teile ("sap", "wartung:ops@*"); liefert Treffer + Facetten-Zählung."""
+        hits = None
+        for part in str(query or "").lower().split():
+            field, sep, value = part.partition(":")
+            if not sep or field not in SEARCH_FIELDS:
+                field, value = "", part
+            for m in self._part_matches(field, value.rstrip("*"), value.endswith("*")):
+                hits = set(m) if hits is None else hits & m
+                if not hits:
+                    break
+            if hits is not None and not hits:
+                break
+        if hits is None:   # keine Suchbegriffe: alles, Zählung direkt aus den Facetten
+            hits = set(self._docs)
+            counts = {f: {v: len(pids) for v, pids in vals.items() if pids} for f, vals in self.facets.items()}
+        else:
+            counts = {f: {v: len(hits & pids) for v, pids in vals.items() if pids} for f, vals in self.facets.items()}
+        for f, wanted in (filters or {}).items():
+            if wanted:
+                hits &= set().union(*(self.facets[f].get(v, set()) for v in wanted))
+        return hits, counts
+
+
+class Portfolio:
+    """Alle bekannten Prozesse (Key = prozess_id) plus die darauf aufbauenden Indizes.
+
+    Hier liegt auch das aktive Gate-2-Profil: Gate 2, Band-Facette und Neubewertung
+    lesen es von hier, damit es nur eine Einstufung gibt.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.g2_profile = G2_DEFAULT_PROFILE
+        self.ranking = RankingIndex()
+        self.duplicates = DuplicateIndex()
+        self.search_index = SearchIndex()
+        self.g2_matrix = Gate2Matrix()
+        self.version = 0   # zählt Änderungen (z. B. als Cache-Key)
+        self.lock = threading.Lock()
+
+    def upsert(self, pid: str, state: dict) -> bool:
+        with self.lock:
+            if self.records.get(pid) == state:
+                return False
+            self.records[pid] = state
+            score = state.get("g2_score")
+            if isinstance(score, (int, float)):
+                self.ranking.update(pid, _order[_current_idx_v(state)], score,
+                                    _cost_benefit(state)["net_benefit_year"])
+            else:
+                self.ranking.remove(pid)
+            self.duplicates.update(pid, *_dup_features(state))
+            self.search_index.update(pid, state, self._g2_band(state))
+            # Nur abgeschickte Bewertungen: die g2_-Widget-Keys existieren schon vor dem Absenden
+            self.g2_matrix.update(pid, _g2_features(state) if isinstance(score, (int, float)) else None)
+            self.version += 1
+            return True
+
+    def remove(self, pid: str) -> bool:
+        with self.lock:
+            if self.records.pop(pid, None) is None:
+                return False
+            self.ranking.remove(pid)
+            self.duplicates.remove(pid)
+            self.search_index.remove(pid)
+            self.g2_matrix.remove(pid)
+            self.version += 1
+            return True
+
+    def _g2_band(self, state: dict) -> str:
+        # Band unter dem aktiven Profil (wie in Gate 2 und der Neubewertung), nicht aus dem
+        # gespeicherten Score, der mit einem früheren Profil berechnet sein kann
+        score = state.get("g2_score")
+        features = _g2_features(state) if isinstance(score, (int, float)) else None
+        if features is not None:
+            score = _gate2_score(features, self.g2_profile)
+        return _g2_band(score, self.g2_profile)
+
+    def set_g2_profile(self, profile: dict):
+        with self.lock:
+            self.g2_profile = profile
+            for pid, state in self.records.items():
+                self.search_index.set_facet(pid, "band", self._g2_band(state))
+            self.version += 1
+
+    def g2_snapshot(self) -> tuple[list, np.ndarray, dict, int]:
+        with self.lock:
+            pids, X = self.g2_matrix.snapshot()
+            names = {pid: self.records[pid].get("prozessname", "") for pid in pids}
+            return pids, X, names, self.version
+
+    def search(self, query: str, filters=None, limit: int = 50) -> tuple[list, int, dict]:
+        with self.lock:
+            hits, counts = self.search_index.search(query, filters)
+            first = heapq.nsmallest(limit, hits, key=lambda p: str(self.records[p].get("prozessname", "")).lower())
+            recs = [(pid, self.records[pid]) for pid in first]
+            return recs, len(hits), counts
+
+    def similar(self, pid: str, state: dict, threshold: float = 0.5) -> list:
+        with self.lock:
+            return [(other, self.records[other], est)
+                    for other, est in self.duplicates.similar(*_dup_features(state), threshold, exclude=pid)]
+
+    def top(self, k: int, stages=None) -> list:
+        with self.lock:
+            return [(pid, self.records[pid], score, nutzen)
+                    for pid, score, nutzen in self.ranking.top(k, stages)]
+
+
+@st.cache_resource
+def _portfolio() -> Portfolio:
+    return Portfolio()
+
+
+def _drop_stale_portfolio_entry():
+    pid = st.session_state["prozess_id"]
+    published = st.session_state.get("_pf_published_id")
+    # Anderer Prozess geladen (neue prozess_id) oder per Undo unter Phase 0 gefallen:
+    # den bisherigen Eintrag dieser Session nicht verwaist im Portfolio lassen
+    if published and (published != pid or not st.session_state.get("phase0_complete")):
+        _portfolio().remove(published)
+        del st.session_state["_pf_published_id"]
+
+
+def _publish_to_portfolio():
+    # Nur auf ausdrücklichen Klick: das Portfolio ist für alle Sessions dieses Servers sichtbar
+    pid = st.session_state["prozess_id"]
+    _portfolio().upsert(pid, make_save_state())
+    st.session_state["_pf_published_id"] = pid
+
+_drop_stale_portfolio_entry()
+
+
+def _check_duplicates():
+    st.session_state["_dup_hits"] = [
+        (rec.get("prozessname", ""), rec.get("prozessowner", ""), est)
+        for _, rec, est in _portfolio().similar(st.session_state["prozess_id"], make_save_state())[:10]
+    ]
+
+
+# ==== Hintergrund-Jobs: ein Executor pro Server, Handles (Job-IDs) im Session State ====
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Handle für eine Hintergrundberechnung; die Job-Funktion meldet über report()
+    Fortschritt und ruft regelmäßig check() auf, damit ein Abbruch greift.
+
+    Das Ergebnis wertet aus, wer den Job startet; für die Job-Übersicht gibt es nur
+    eine kurze Zusammenfassung über den optionalen Formatter `summary(result) -> str`.
+    """
+
+    def __init__(self, job_id: str, label: str, summary=None):
+        self.id, self.label = job_id, label
+        self._summary = summary
+        self.progress, self.message = 0.0, ""
+        self.started = time.time()
+        self.future = None
+        self._cancel = threading.Event()
+
+    def report(self, fraction: float, message: str = ""):
+        self.progress, self.message = max(0.0, min(1.0, fraction)), message
+        self.check()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._cancel.set()
+        self.future.cancel()   # greift nur, solange der Job noch in der Warteschlange steht
+
+    def summary(self) -> str:
+        if self._summary is None or self.status != "fertig":
+            return ""
+        return self._summary(self.future.result())
+
+    @property
+    def status(self) -> str:
+        if not self.future.done():
+            return "abbrechen …" if self._cancel.is_set() else ("läuft" if self.future.running() else "wartet")
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return "abgebrochen"
+        return "Fehler" if self.future.exception() else "fertig"
+
+
+class JobManager:
+    """Begrenzte Parallelität (ThreadPool) + kleiner LRU-Cache für Ergebnisse gleicher Eingaben."""
+
+    MAX_FINISHED = 200
+
+    def __init__(self, max_workers: int = min(4, os.cpu_count() or 1), cache_size: int = 32):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rpa-job")
+        self._jobs = OrderedDict()   # job_id -> Job
+        self._cache = OrderedDict()  # cache_key -> Ergebnis
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def submit(self, label: str, fn, *args, cache_key=None, summary=None) -> str:
+        """fn(job, *args) läuft im Hintergrund; liefert die Job-ID für den Session State."""
+        job = Job(uuid.uuid4().hex[:12], label, summary)
+        with self._lock:
+            if cache_key is not None and cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                job.future = Future()
+                job.future.set_result(self._cache[cache_key])
+                job.progress, job.message = 1.0, "aus dem Cache"
+            self._jobs[job.id] = job
+            self._prune()
+
+        if job.future is None:
+            def run():
+                result = fn(job, *args)
+                job.progress = 1.0
+                if cache_key is not None:
+                    with self._lock:
+                        self._cache[cache_key] = result
+                        while len(self._cache) > self._cache_size:
+                            self._cache.popitem(last=False)
+                return result
+            job.future = self._executor.submit(run)
+        return job.id
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        # Abgeschlossene Jobs nicht ewig halten (Sessions, die nie wieder pollen)
+        finished = [jid for jid, j in self._jobs.items() if j.future is not None and j.future.done()]
+        for jid in finished[:max(0, len(finished) - self.MAX_FINISHED)]:
+            del self._jobs[jid]
+
+
+@st.cache_resource
+def _jobs() -> JobManager:
+    return JobManager()
+
+
+def _start_job(label: str, fn, *args, cache_key=None, summary=None) -> str:
+    job_id = _jobs().submit(label, fn, *args, cache_key=cache_key, summary=summary)
+    st.session_state.setdefault("_job_ids", []).append(job_id)
+    return job_id
+
+
+def _import_snapshots_job(job: Job, portfolio: Portfolio, files: list, done_sigs: list) -> dict:
+    """Zwischenstände (Signatur, Name, Bytes) parsen, bereinigen und ins Portfolio übernehmen.
+
+    Das Portfolio kommt als Argument aus dem Script-Thread (im Pool gibt es keinen
+    Streamlit-Kontext). Erfolgreich übernommene Signaturen landen in done_sigs, damit
+    die Session sie auch nach einem Abbruch kennt.
+    """
+    ok, errors = 0, []
+    for i, (sig, name, data_bytes) in enumerate(files):
+        job.report(i / len(files), f"{i}/{len(files)} Dateien")
+        # Fehler pro Datei abfangen (wie beim Laden), eine kaputte Datei stoppt den Rest nicht
+        try:
+            loaded = _read_snapshot(name, data_bytes)
+            if not isinstance(loaded, dict):
+                errors.append(f"{name}: kein JSON-Objekt")
+                continue
+            cleaned = _clean_state(loaded, _content_id(data_bytes))
+            portfolio.upsert(cleaned["prozess_id"], cleaned)
+        except Exception as e:
+            errors.append(f"{name}: nicht lesbar ({type(e).__name__}: {e})")
+            continue
+        done_sigs.append(sig)
+        ok += 1
+    return {"importiert": ok, "fehler": errors}
+
+
+def _job_panel():
+    # Nur Status: Label, Fortschritt, Abbrechen und eine kurze Zusammenfassung.
+    # Ergebnisse zeigt der Teil der App an, der den Job gestartet hat.
+    job_ids = st.session_state.get("_job_ids", [])
+    seen_done = st.session_state.setdefault("_jobs_seen_done", set())
+    any_new_done = False
+    for job_id in list(job_ids):
+        job = _jobs().get(job_id)
+        if job is None:   # vom Server aufgeräumt
+            job_ids.remove(job_id)
+            continue
+        st.progress(job.progress, text=f"{job.label} · {job.status} {job.message}".strip())
+        if not job.future.done():
+            if st.button("Abbrechen", key=f"job_cancel_{job_id}"):
+                job.cancel()
+        else:
+            if job.summary():
+                st.caption(job.summary())
+            elif job.status == "Fehler":
+                st.error(f"{job.label}: {job.future.exception()}")
+            if st.button("Ausblenden", key=f"job_hide_{job_id}"):
+                job_ids.remove(job_id)
+                st.rerun()
+            if job_id not in seen_done:
+                seen_done.add(job_id)
+                any_new_done = True
+    if any_new_done:
+        st.rerun()   # Ergebnisse (Portfolio, Suche) in der ganzen App sichtbar machen
+
+# Nur pollen, solange ein Job wartet oder läuft; danach reicht der normale Lauf
+_job_panel_live = st.fragment(run_every=1.0)(_job_panel)
+
+
+with st.expander("📋 Automatisierungs-Backlog (Portfolio)", expanded=False):
+    st.info("ℹ️ Das Portfolio liegt nur im Arbeitsspeicher dieses Servers: Es ist für **alle Nutzenden "
+            "dieser App** sichtbar (Prozessname, Owner, E-Mail-Adressen aus Phase 1) und ist nach "
+            "einem Neustart leer. Zum Aufbewahren die Zwischenstände als Datei speichern.")
+
+    if st.session_state.get("phase0_complete"):
+        pid = st.session_state["prozess_id"]
+        published = st.session_state.get("_pf_published_id") == pid
+        if st.button("📋 Aktuellen Prozess ins Portfolio übernehmen" if not published
+                     else "🔄 Portfolio-Eintrag aktualisieren", key="btn_pf_publish"):
+            _publish_to_portfolio()
+            st.rerun()
+        if published:
+            current = _portfolio().records.get(pid) == make_save_state()
+            st.caption("Im Portfolio " + ("– aktuell." if current else "– **veraltet**, bitte aktualisieren."))
+    else:
+        st.caption("Der aktuelle Prozess kann nach Abschluss von Phase 0 übernommen werden.")
+
+    pf_files = st.file_uploader("Weitere Zwischenstände ins Portfolio übernehmen (.json / .json.gz)",
+                                type=["json","gz"], accept_multiple_files=True, key="pf_uploader")
+    imported = st.session_state.setdefault("_pf_import_sigs", set())
+    failed = st.session_state.setdefault("_pf_import_failed", set())
+    import_jobs = st.session_state.setdefault("_pf_import_jobs", {})   # job_id -> (Signaturen, erledigte)
+
+    # Abgeschlossene Import-Jobs auswerten: nur erfolgreiche Dateien gelten als importiert
+    for job_id, (sigs, done_sigs) in list(import_jobs.items()):
+        job = _jobs().get(job_id)
+        if job is None or job.future.done():
+            imported.update(done_sigs)
+            failed.update(set(sigs) - set(done_sigs))
+            if job is not None and job.status == "fertig":
+                st.session_state["_pf_import_errors"] = job.future.result()["fehler"]
+            del import_jobs[job_id]
+    for err in st.session_state.get("_pf_import_errors", []):
+        st.error(err)
+    pending = {sig for sigs, _ in import_jobs.values() for sig in sigs}
+
+    files = [(*_file_signature(f), f.name) for f in pf_files or []]
+    # Fehlgeschlagene erst wieder versuchen, wenn die Datei neu hochgeladen wird
+    failed &= {sig for sig, _, _ in files}
+    new_files = [(sig, name, data) for sig, data, name in files
+                 if sig not in imported and sig not in pending and sig not in failed]
+    if new_files:
+        # Import läuft im Hintergrund, damit große Mengen die Session nicht blockieren
+        done_sigs = []
+        job_id = _start_job(f"Import ({len(new_files)} Dateien)", _import_snapshots_job,
+                            _portfolio(), new_files, done_sigs,
+                            summary=lambda r: f"{r['importiert']} importiert, {len(r['fehler'])} Fehler")
+        import_jobs[job_id] = ([sig for sig, _, _ in new_files], done_sigs)
+
+    c1, c2 = st.columns([1, 3])
+    top_k = c1.number_input("Top-k", min_value=1, max_value=1000, value=50, step=10, key="pf_top_k")
+    stage_filter = c2.multiselect("Stage-Filter", _order, format_func=_STAGE_LABELS.get, key="pf_stages")
+
+    t0 = time.perf_counter()
+    rows = _portfolio().top(int(top_k), stage_filter or None)
+    dt_ms = (time.perf_counter() - t0) * 1000.0
+
+    if rows:
+        st.dataframe([
+            {
+                "Rang": i,
+                "Prozess": rec.get("prozessname", ""),
+                "Owner": rec.get("prozessowner", ""),
+                "Stage": _STAGE_LABELS[_order[_current_idx_v(rec)]],
+                "RPA-Score": round(score, 2),
+                "Netto-Nutzen / Jahr (€)": round(nutzen, 2),
+            }
+            for i, (pid, rec, score, nutzen) in enumerate(rows, start=1)
+        ], use_container_width=True, hide_index=True)
+    else:
+        st.info("Noch keine Prozesse mit RPA-Score im Portfolio.")
+    st.caption(f"{len(_portfolio().ranking)} bewertete Prozesse · Abfrage in {dt_ms:.1f} ms")
+
+
+with st.expander("⚖️ Gate-2-Profile: Portfolio neu bewerten", expanded=False):
+    base_profile = _portfolio().g2_profile
+    st.caption(f"Vergleich gegen das aktive Profil „{base_profile['name']}“. "
+               "Ein übernommenes Profil gilt für alle Sessions dieses Servers.")
+
+    alt_name = st.text_input("Name des Profils", value="Test-Profil", key="g2p_name")
+    st.markdown("**Gewichte der 12 Kriterien**")
+    cols = st.columns(3)
+    alt_weights = {
+        k: cols[i % 3].number_input(k, min_value=0.0, step=0.25, value=float(base_profile["weights"][k]),
+                                    key=f"g2p_w_{k}", help=frage)
+        for i, (k, frage) in enumerate(G2_CRITERIA.items())
+    }
+    c1, c2, c3 = st.columns(3)
+    t_thr_txt = c1.text_input("T-Schwellen (Min./Woche)", value=", ".join(f"{v:g}" for v in base_profile["t_thresholds"]), key="g2p_t_thr")
+    t_sc_txt  = c2.text_input("T-Punkte je Stufe", value=", ".join(f"{v:g}" for v in base_profile["t_scores"]), key="g2p_t_sc")
+    t_weight  = c3.number_input("Gewicht T", min_value=0.0, step=0.25, value=float(base_profile["t_weight"]), key="g2p_t_w")
+    benefit_total  = c1.number_input("Nutzen: Anzahl für volle Punktzahl", min_value=1.0, step=1.0, value=float(base_profile["benefit_total"]), key="g2p_b_total")
+    benefit_weight = c2.number_input("Gewicht Nutzen", min_value=0.0, step=0.25, value=float(base_profile["benefit_weight"]), key="g2p_b_w")
+    norm = c3.number_input("Normierung (Maximalpunkte)", min_value=0.01, step=1.0, value=float(base_profile["norm"]), key="g2p_norm")
+    cut_ok  = c1.number_input("Schwelle „Geeignet“", min_value=0.0, max_value=100.0, value=float(base_profile["cutoffs"][0]), key="g2p_cut_ok")
+    cut_top = c2.number_input("Schwelle „Sehr gut geeignet“", min_value=0.0, max_value=100.0, value=float(base_profile["cutoffs"][1]), key="g2p_cut_top")
+
+    try:
+        t_thresholds = [float(v) for v in t_thr_txt.split(",") if v.strip()]
+        t_scores = [float(v) for v in t_sc_txt.split(",") if v.strip()]
+    except ValueError:
+        t_thresholds, t_scores = [], []
+    if len(t_scores) != len(t_thresholds) + 1 or t_thresholds != sorted(t_thresholds) or cut_ok > cut_top:
+        st.error("T-Schwellen aufsteigend angeben, T-Punkte mit genau einem Wert mehr; "
+                 "„Geeignet“ ≤ „Sehr gut geeignet“.")
+        alt_profile = None
+    else:
+        alt_profile = {
+            "name": alt_name.strip() or "Test-Profil", "weights": alt_weights,
+            "t_thresholds": t_thresholds, "t_scores": t_scores, "t_weight": t_weight,
+            "benefit_total": benefit_total, "benefit_weight": benefit_weight,
+            "norm": norm, "cutoffs": [cut_ok, cut_top],
+        }
+
+    b1, b2 = st.columns(2)
+    if b1.button("Portfolio neu bewerten", disabled=alt_profile is None, key="btn_g2p_rescore"):
+        pids, X, names, version = _portfolio().g2_snapshot()
+        st.session_state["_g2_diff_job"] = _start_job(
+            f"Neubewertung „{alt_profile['name']}“", _g2_profile_diff_job, pids, X, base_profile, alt_profile, names,
+            cache_key=("g2_diff", version, json.dumps([base_profile, alt_profile], sort_keys=True)),
+            summary=lambda r: f"{r['n_changed']} / {r['n']} Bandwechsel",
+        )
+    if b2.button("Als Gate-2-Profil übernehmen", disabled=alt_profile is None, key="btn_g2p_apply"):
+        _portfolio().set_g2_profile(alt_profile)
+        st.rerun()
+
+    diff_job = _jobs().get(st.session_state.get("_g2_diff_job", ""))
+    if diff_job is not None and diff_job.status == "fertig":
+        diff = diff_job.future.result()
+        st.metric("Prozesse mit Bandwechsel", f"{diff['n_changed']} / {diff['n']}")
+        st.dataframe([
+            {"Band alt": G2_BANDS[i], **{G2_BANDS[j]: diff["matrix"][(G2_BANDS[i], G2_BANDS[j])] for j in range(3)}}
+            for i in range(3)
+        ], use_container_width=True, hide_index=True)
+        if diff["changed"]:
+            st.dataframe(diff["changed"], use_container_width=True, hide_index=True)
+            if diff["n_changed"] > len(diff["changed"]):
+                st.caption(f"Angezeigt: die ersten {len(diff['changed'])} Wechsel.")
+    elif diff_job is not None:
+        st.caption(f"Neubewertung: {diff_job.status} (Fortschritt in der Sidebar).")
+
+
+with st.sidebar:
+    st.markdown("---")
+    st.markdown("### 🔎 Portfolio-Suche")
+    search_q = st.text_input("Suchbegriffe", key="search_q",
+                             placeholder="z. B. systeme:sap wartung:ops@*",
+                             help="Alle Begriffe müssen passen; `*` am Ende = Präfix. "
+                                  f"Felder: {', '.join(SEARCH_FIELDS)}")
+    # Eine Abfrage für Treffer + Facetten; die Auswahl steht über die Keys schon im State
+    filters = {"stage": st.session_state.get("search_stages", []), "band": st.session_state.get("search_bands", [])}
+    search_active = bool(search_q.strip() or any(filters.values()))
+    t0 = time.perf_counter()
+    results, total, facet_counts = _portfolio().search(search_q, filters, limit=50 if search_active else 0)
+    dt_ms = (time.perf_counter() - t0) * 1000.0
+
+    st.multiselect("Stage", _order, key="search_stages",
+                   format_func=lambda v: f"{_STAGE_LABELS[v]} ({facet_counts['stage'].get(v, 0)})")
+    st.multiselect("Gate-2-Band", G2_BANDS, key="search_bands",
+                   format_func=lambda v: f"{v} ({facet_counts['band'].get(v, 0)})")
+
+    if search_active:
+        st.caption(f"{total} Treffer · {dt_ms:.1f} ms")
+        for pid, rec in results:
+            st.markdown(f"- **{rec.get('prozessname') or pid}** · {_STAGE_LABELS[_order[_current_idx_v(rec)]]}  \n"
+                        f"  {rec.get('p1_systeme') or '–'} · Wartung: {rec.get('p1_wartung') or '–'}")
+
+with st.sidebar:
+    st.markdown("---")
+    st.markdown("### ⏪ Verlauf")
+    hist = _history()
+    u1, u2 = st.columns(2)
+    if u1.button("↶ Rückgängig", disabled=hist.cursor <= 0, key="btn_undo", use_container_width=True):
+        st.session_state["_history_restore"] = hist.cursor - 1
+        st.rerun()
+    if u2.button("↷ Wiederholen", disabled=hist.cursor >= len(hist.versions) - 1, key="btn_redo", use_container_width=True):
+        st.session_state["_history_restore"] = hist.cursor + 1
+        st.rerun()
+
+    gate_versions = [i for i, (_, _, gate) in enumerate(hist.versions) if gate]
+    if gate_versions:
+        target = st.selectbox("Stand vor/nach Gate-Entscheidung", gate_versions[::-1], key="history_target",
+                              format_func=lambda i: f"#{i} {hist.versions[i][0]}" + (" ← aktuell" if i == hist.cursor else ""))
+        b1, b2 = st.columns(2)
+        if b1.button("Stand davor", disabled=target is None or target == 0, key="btn_history_before", use_container_width=True):
+            st.session_state["_history_restore"] = target - 1
+            st.rerun()
+        if b2.button("Stand danach", disabled=target is None, key="btn_history_after", use_container_width=True):
+            st.session_state["_history_restore"] = target
+            st.rerun()
+    # Statistik nur auf Anfrage: sie läuft über alle Knoten aller Versionen
+    if st.button("📊 Speicherbedarf des Verlaufs", key="btn_history_stats", use_container_width=True):
+        n_versions, n_nodes, n_unshared = hist.stats()
+        st.caption(f"{n_versions} Versionen · {n_nodes} Knoten gehalten (ohne Sharing: {n_unshared})")
+    else:
+        st.caption(f"{len(hist.versions)} Versionen")
+
+    if st.session_state.get("_job_ids"):
+        st.markdown("---")
+        st.markdown("### ⚙️ Hintergrund-Jobs")
+        jobs_active = any((j := _jobs().get(jid)) is not None and not j.future.done()
+                          for jid in st.session_state["_job_ids"])
+        (_job_panel_live if jobs_active else _job_panel)()
+
 main, aside = st.columns([7, 3], gap="small")  
 
 with aside:
@@ -273,9 +1280,18 @@ with main:
         eigentuemer = st.text_input("Wer ist Prozess-Owner?", key="prozessowner")
 
 
+        # Mögliche Dubletten aus dem Portfolio (bei Abschluss von Phase 0 nur über den Namen,
+        # bei Abschluss von Phase 1 erneut mit IT-Systemen und Gate-1-Antworten)
+        dup_hits = st.session_state.get("_dup_hits") or []
+        if dup_hits:
+            st.warning("⚠️ Ähnliche Prozesse im Portfolio – bitte prüfen, ob es sich um eine Dublette handelt:")
+            for name, owner, est in dup_hits:
+                st.markdown(f"- **{name}** (Owner: {owner or '–'}) · Ähnlichkeit ≈ {est:.0%}")
+
         if st.button("✅ Phase 0 abschließen"):
             if prozessname.strip() and eigentuemer.strip():
                 st.session_state.phase0_complete = True
+                _check_duplicates()
                 st.success("✅ Phase 0 abgeschlossen – weiter zu Gate 1.")
                 st.rerun() 
             else:
@@ -313,9 +1329,11 @@ with main:
                     if not falsch:
                         st.success("✅ Gate 1 bestanden. Prozess geeignet – weiter zu Phase 1.")
                         st.session_state["gate1_complete"] = True
+                        _record_version("Gate 1: bestanden", gate=True)
                         st.rerun()
                     else:
                         st.session_state["gate1_complete"] = False
+                        _record_version("Gate 1: nicht bestanden", gate=True)
                         st.error("❌ Prozess ist (noch) nicht geeignet. Bitte folgende Punkte anpassen:")
                         for t in falsch:
                             st.markdown(f"- {t}")
@@ -332,11 +1350,11 @@ with main:
             q_it        = st.radio("Ist der Prozess technisch umsetzbar (IT-Infrastruktur)?", ["Ja", "Nein"], horizontal=True)
             q_capacity  = st.radio("Sind Kapazitäten für Wartung & Betrieb vorhanden?", ["Ja", "Nein"], horizontal=True)
 
-            betreiber   = st.text_input("Wer ist für den **Betrieb** des RPA-Bots zuständig? (E-Mail)")
-            wartung     = st.text_input("Wer ist für die **Wartung** des RPA-Bots zuständig? (E-Mail)")
+            betreiber   = st.text_input("Wer ist für den **Betrieb** des RPA-Bots zuständig? (E-Mail)", key="p1_betreiber")
+            wartung     = st.text_input("Wer ist für die **Wartung** des RPA-Bots zuständig? (E-Mail)", key="p1_wartung")
 
             q_endusers  = st.radio("Sind alle End-Benutzenden des Prozesses berücksichtigt worden?", ["Ja", "Nein"], horizontal=True)
-            systeme     = st.text_input("Welche existierenden IT-Systeme sind involviert?")
+            systeme     = st.text_input("Welche existierenden IT-Systeme sind involviert?", key="p1_systeme")
 
             q_doc_full  = st.radio("Wurde der Prozess ausführlich dokumentiert?", ["Ja", "Nein"], horizontal=True)
             q_time_log  = st.radio("Wurde ein Zeitprotokoll des Prozesses erstellt?", ["Ja", "Nein"], horizontal=True)
@@ -353,6 +1371,7 @@ with main:
                 if radios_ok and betreiber_ok and wartung_ok and systeme_ok:
                     st.success("✅ Phase 1 abgeschlossen – weiter zu Gate 2.")
                     st.session_state.phase1_complete = True
+                    _check_duplicates()
                     st.rerun() 
                 else:
                     if not radios_ok:
@@ -372,85 +1391,50 @@ with main:
         with st.expander("Gate 2: RPA-Score", expanded=True):
             st.subheader("RPA-Score berechnen")
 
-            ternary = {"Ja": 1.0, "Nein": 0.0, "Unbekannt": 0.5}
+            profile = _portfolio().g2_profile
+            c_ok, c_top = profile["cutoffs"]
 
             with st.form("gate2_form"):
                 # 12 binäre/ternäre Kriterien
-                q = {}
-                q["apps_zugang"]      = st.radio("Sind alle Anwendungen / Software zugänglich?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["schon_autom"]      = st.radio("Ist der Prozess bereits in einer anderen Form automatisiert?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["komplex"]          = st.radio("Ist der Prozess komplex?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["nur_digital"]      = st.radio("Werden nur digitale Daten verwendet?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["aenderung"]        = st.radio("Bleibt der Prozess in näherer Zukunft unverändert?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["stabil_stabile_sw"]= st.radio("Ist der Prozess stabil und verwendet stabile Anwendungen?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["standardisiert"]   = st.radio("Ist der Prozess standardisiert?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["strukturierte"]    = st.radio("Verwendet der Prozess strukturierte Daten?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["begrenzte_ausn"]   = st.radio("Hat der Prozess begrenzte Ausnahmen/Alternativen?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["mehrere_systeme"]   = st.radio("Verwendet der Prozess mehrere Systeme?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                q["mehrere_personen"]  = st.radio("Wird der Prozess von mehreren Personen bearbeitet?", ["Ja","Nein","Unbekannt"], horizontal=True)
-                richtlinien           = st.radio("Sind die Richtlinien des Prozesses eindeutig und klar dokumentiert?", ["Ja","Nein","Unbekannt"], horizontal=True)
+                for key, frage in G2_CRITERIA.items():
+                    st.radio(frage, list(G2_TERNARY), horizontal=True, key=f"g2_{key}")
 
                 st.markdown("### Gesamtzeit des Prozesses (pro Woche)")
-                dauer_min = st.number_input("Wie lange dauert der Prozess (eine Ausführung)? (Minuten)", min_value=0, step=1, value=0)
-                freq_w   = st.number_input("Wie häufig kommt der Prozess pro Woche vor? (Anzahl)", min_value=0, step=1, value=0)
+                st.number_input("Wie lange dauert der Prozess (eine Ausführung)? (Minuten)", min_value=0, step=1, value=0, key="g2_dauer_min")
+                st.number_input("Wie häufig kommt der Prozess pro Woche vor? (Anzahl)", min_value=0, step=1, value=0, key="g2_freq_w")
 
                 st.markdown("### Nutzen des Prozesses (Mehrfachauswahl möglich)")
-                alle_benefits = [
-                    "Reduzierte Prozesszeiten",
-                    "Entlastung der Routinearbeiten",
-                    "Geringere Fehlerquote",
-                    "Erhöhte Kundenzufriedenheit und -service",
-                    "24 / 7 Betrieb",
-                    "Verbesserung der Mitarbeitenden-Skills",
-                    "Standardisierung",
-                ]
-                selected_benefits = st.multiselect("Welchen Nutzen wird die Automatisierung haben?", alle_benefits, default=[])
+                st.multiselect("Welchen Nutzen wird die Automatisierung haben?", G2_BENEFITS, default=[], key="g2_benefits")
 
                 submit = st.form_submit_button("RPA-Score berechnen")
 
             if submit:
-                # --- 1) Binär/Ternär (12 Faktoren) ---
-                bin_sum = sum(ternary[v] for v in q.values()) + ternary[richtlinien]  # 12 Faktoren
-
-                # --- 2) Gesamtzeit T = Dauer * Häufigkeit; auf 0..1 mappen gemäß Tabelle ---
-                T = float(dauer_min) * float(freq_w)  # Minuten/Woche
-                if T < 30:
-                    t_score = 0.0
-                elif T < 60:
-                    t_score = 0.25
-                elif T < 180:
-                    t_score = 0.5
-                else:
-                    t_score = 1.0
-
-                # --- 3) Nutzen linear gestaffelt: Anteil der ausgewählten Vorteile von 7 ---
-                benefit_score = (len(selected_benefits) / 7.0)
-
-                # --- 4) Gesamtscore x = (11 Binär/Ternär) + (T) + (Nutzen) = 13 Kriterien
-                x = bin_sum + t_score + benefit_score
-
-                # --- 5) Normalisieren auf 0..100 
-                N = round((x * 100.0) / 14.0, 2)
+                # --- 1)–5) Kriterien, Gesamtzeit T, Nutzen gewichtet gemäß Profil, normiert auf 0..100
+                N = _gate2_score(_g2_features(st.session_state), profile)
 
                 # --- 6) Einordnung ---
-                if N < 50:
-                    level = "🔴 Ungeeignet (<50)"
-                elif N < 70:
-                    level = "🟡 Geeignet (50–69)"
+                if N < c_ok:
+                    level = f"🔴 Ungeeignet (<{c_ok:g})"
+                elif N < c_top:
+                    level = f"🟡 Geeignet ({c_ok:g} – <{c_top:g})"
                 else:
-                    level = "🟢 Sehr gut geeignet (≥70)"
+                    level = f"🟢 Sehr gut geeignet (≥{c_top:g})"
 
                 st.metric("RPA-Score", f"{N:.2f} / 100")
                 st.write(f"**Einstufung:** {level}")
+                if profile is not G2_DEFAULT_PROFILE:
+                    st.caption(f"Bewertet mit Profil „{profile['name']}“.")
 
 
                 # --- 7) Gate-Fortschritt setzen ---
-                if N >= 50:
+                st.session_state["g2_score"] = N   # fürs Portfolio-Ranking
+                if N >= c_ok:
                     st.session_state["gate2_complete"] = True
                     st.success("Gate 2 abgeschlossen – weiter zur **Phase 2**.")
                 else:
                     st.session_state["gate2_complete"] = False
-                    st.error("Score < 50 → Prozess aktuell **nicht** geeignet. Bitte optimieren/prüfen.")
+                    st.error(f"Score < {c_ok:g} → Prozess aktuell **nicht** geeignet. Bitte optimieren/prüfen.")
+                _record_version(f"Gate 2: Score {N:.2f}", gate=True)
 
 
     # -------------------------------------------------------------------
@@ -460,7 +1444,7 @@ with main:
         with st.expander("Phase 2: Design- / Entwicklungsphase", expanded=True):
             st.subheader("Planung der Entwicklung")
 
-            entwickler = st.text_input("Wer übernimmt die Entwicklung des Bots? (Name/Team)")
+            entwickler = st.text_input("Wer übernimmt die Entwicklung des Bots? (Name/Team)", key="p2_entwickler")
             req_clarified = st.radio(
                 "Wurde der Prozess überprüft und die Anforderungen mit dem Prozess-Owner abgeklärt?",
                 ["Ja", "Nein"], horizontal=True
@@ -523,6 +1507,7 @@ with main:
                 if pos_ok and neg_ok:
                     st.success("✅ Gate 3 bestanden – weiter zur Testphase (Gate 4).")
                     st.session_state.gate3_complete = True
+                    _record_version("Gate 3: bestanden", gate=True)
                     st.rerun() 
                 else:
                     if not pos_ok:
@@ -576,6 +1561,7 @@ with main:
                 if all(ans == "Ja" for ans in g4_answers.values()):
                     st.success("✅ Gate 4 bestanden – der Bot ist produktionsreif. Weiter zu Phase 4.")
                     st.session_state.gate4_complete = True
+                    _record_version("Gate 4: bestanden", gate=True)
                     st.rerun() 
                 else:
                     st.error("Alle Kriterien müssen mit **Ja** beantwortet sein, damit Gate 4 bestanden wird.")
@@ -626,6 +1612,7 @@ with main:
                 if ok_for_users == "Ja":
                     st.success("✅ Gate 5 bestanden – Go-Live freigegeben.")
                     st.session_state.gate5_complete = True
+                    _record_version("Gate 5: Go-Live freigegeben", gate=True)
                     st.rerun() 
                     # Optional: Gesamtabschluss markieren
                     st.session_state.all_complete = True
@@ -636,6 +1623,7 @@ with main:
                     st.session_state.gate3_complete = False
                     st.session_state.phase3_complete = False
                     st.session_state.gate4_complete = False
+                    _record_version("Gate 5: nicht freigegeben", gate=True)
                     st.stop()
                 
     # -------------------------------------------------------------------
@@ -725,19 +1713,11 @@ with main:
                 # --- Auswertung & Diagramm nur zeigen, wenn Flag aktiv ---
                 if st.session_state.get("pic_show_chart", False):
                     # Aus dem Session State lesen (stabil über Re-Runs)
-                    err_rate   = float(st.session_state.get("pic_err_rate", 0.0))
-                    mttr_min   = float(st.session_state.get("pic_fix_min", 0.0))
-                    save_min_w = float(st.session_state.get("pic_save_min", 0.0))
-                    runs_w     = int(st.session_state.get("pic_runs_week", 0))
-                    rate_eur_h = float(st.session_state.get("pic_hourly_cost", 20.0))
-
-                    error_events_per_week = runs_w * (err_rate / 100.0)
-                    error_minutes_week    = error_events_per_week * mttr_min
-                    error_cost_week       = (error_minutes_week / 60.0) * rate_eur_h
-
-                    saving_cost_week      = (save_min_w / 60.0) * rate_eur_h
-                    net_benefit_week      = saving_cost_week - error_cost_week
-                    net_benefit_year      = net_benefit_week * 52
+                    cb = _cost_benefit(st.session_state)
+                    error_cost_week  = cb["error_cost_week"]
+                    saving_cost_week = cb["saving_cost_week"]
+                    net_benefit_week = cb["net_benefit_week"]
+                    net_benefit_year = cb["net_benefit_year"]
 
                     c1, c2, c3 = st.columns(3)
                     c1.metric("Kosten Fehlerbehebung / Woche", f"{error_cost_week:,.2f} €")
@@ -757,14 +1737,7 @@ with main:
                     st.pyplot(fig, clear_figure=True)
 
                     # optional für Export
-                    st.session_state["pic_cost_benefit"] = {
-                        "error_cost_week": error_cost_week,
-                        "saving_cost_week": saving_cost_week,
-                        "net_benefit_week": net_benefit_week,
-                        "net_benefit_year": net_benefit_year,
-                        "runs_per_week": runs_w,
-                        "hourly_cost": rate_eur_h,
-                    }
+                    st.session_state["pic_cost_benefit"] = cb
 
             else:
                 st.info("Bitte eine KPI-Messung etablieren (Monitoring, Protokollierung, Dashboard), "
@@ -795,3 +1768,6 @@ with main:
                 else:
                     st.error("Post-Implementation-Check kann erst abgeschlossen werden, wenn KPIs gemessen werden (Antwort „Ja“).")
 
+
+# Neu gerenderte Widgets: Defaults für den Verlauf merken (Eingaben im nächsten Lauf = Änderung)
+_history().note_defaults(make_save_state())